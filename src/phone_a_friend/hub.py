@@ -6,19 +6,40 @@ Start with: python -m phone_a_friend.hub
 """
 
 import asyncio
-import json
+import contextlib
+import heapq
+import itertools
+import os
+import stat
 import time
 from dataclasses import dataclass, field
 from typing import Optional
 import signal
 import sys
 
+from .protocol import (
+    HUB_SOCKET_PATH, MAX_FRAME_SIZE, PROTOCOL_VERSION, STREAM_LIMIT, WRITE_HIGH_WATER, FrameError,
+    dumps, frame_header, loads, read_frame,
+)
+
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 7777
 IDLE_TIMEOUT_SECONDS = 60 * 60  # 60 minutes
+WRITE_BATCH = 64  # max queued messages coalesced into one write
+OUTBOX_LIMIT = 2 * MAX_FRAME_SIZE  # queued bytes per client before sends to it fail
+
+class OutboxFullError(ConnectionError):
+    """A client stopped reading and its queued messages reached OUTBOX_LIMIT."""
+
+
+class SocketPathError(RuntimeError):
+    """The UNIX socket path can be taken over by another user."""
+
 
+TIMEOUT_MESSAGE_JSON = dumps(f"Session closed after {IDLE_TIMEOUT_SECONDS // 60} minutes idle")
 
-@dataclass
+
+@dataclass(slots=True, eq=False)
 class Session:
     """An active listening session."""
     name: str
@@ -26,15 +47,38 @@ class Session:
     writer: asyncio.StreamWriter
     current_caller: Optional[str] = None
     current_intent: Optional[str] = None
+    # JSON-encoded once per connect and spliced into every forwarded message
+    intent_json: bytes = b"null"
+    banner_with_directive_json: bytes = b"null"
+    banner_no_directive_json: bytes = b"null"
     last_activity: float = field(default_factory=time.time)
 
 
-@dataclass
+@dataclass(slots=True)
+class Outbox:
+    """Encoded messages waiting for a connection's writer task."""
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    size: int = 0  # payload bytes queued or not yet flushed, bounded by OUTBOX_LIMIT
+
+
+@dataclass(slots=True)
 class HubState:
-    """Global state for the hub."""
+    """Global state for the hub.
+
+    Handlers never await between reading and mutating this state, so the
+    event loop already runs each update atomically and no lock is needed.
+    """
     sessions: dict[str, Session] = field(default_factory=dict)
     callers: dict[str, asyncio.StreamWriter] = field(default_factory=dict)
-    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    outboxes: dict[asyncio.StreamWriter, Outbox] = field(default_factory=dict)
+    # Reverse indexes so disconnect cleanup only touches the connection's own entries
+    sessions_by_writer: dict[asyncio.StreamWriter, set[str]] = field(default_factory=dict)
+    callers_by_writer: dict[asyncio.StreamWriter, set[str]] = field(default_factory=dict)
+    # Min-heap of (deadline, seq, session); entries are re-checked lazily when they fall due
+    idle_heap: list[tuple[float, int, Session]] = field(default_factory=list)
+    idle_seq: itertools.count = field(default_factory=itertools.count)
+    # Encoded list_sessions reply; reset to None whenever a session or its busy flag changes
+    session_list_json: Optional[bytes] = None
 
 
 state = HubState()
@@ -49,11 +93,95 @@ def format_intent_banner(intent: str, include_directive: bool = True) -> str:
     return banner
 
 
-async def send_response(writer: asyncio.StreamWriter, response: dict) -> None:
-    """Send a JSON response to a client."""
-    data = json.dumps(response) + "\n"
-    writer.write(data.encode())
-    await writer.drain()
+def register_caller(name: str, writer: asyncio.StreamWriter) -> None:
+    """Record the connection that responses for a caller should go to."""
+    state.callers[name] = writer
+    state.callers_by_writer.setdefault(writer, set()).add(name)
+
+
+def schedule_idle_check(session: Session, deadline: float) -> None:
+    """Queue a session to be looked at by the idle reaper at the given time."""
+    heapq.heappush(state.idle_heap, (deadline, next(state.idle_seq), session))
+
+
+def remove_session(session_name: str) -> Optional[Session]:
+    """Unregister a session and drop it from its connection's index."""
+    session = state.sessions.pop(session_name, None)
+    if session:
+        state.sessions_by_writer.get(session.writer, set()).discard(session_name)
+        state.session_list_json = None
+        prune_idle_heap()
+    return session
+
+
+def prune_idle_heap() -> None:
+    """Drop heap entries for ended or replaced sessions once they outnumber live ones.
+
+    Rebuilding in place keeps the heap within about twice the live session
+    count, so removed sessions (and their writers) aren't held until their
+    deadline comes round.
+    """
+    heap = state.idle_heap
+    if len(heap) <= 2 * len(state.sessions) + 16:
+        return
+    heap[:] = [entry for entry in heap if state.sessions.get(entry[2].name) is entry[2]]
+    heapq.heapify(heap)
+
+
+def send_payload(writer: asyncio.StreamWriter, payload: bytes) -> None:
+    """Queue an encoded message for a client; its writer task adds the framing."""
+    outbox = state.outboxes.get(writer)
+    if outbox is None or writer.is_closing():
+        raise ConnectionResetError("Connection closed")
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Message of {len(payload)} bytes exceeds the {MAX_FRAME_SIZE}-byte frame limit")
+    if outbox.size + len(payload) > OUTBOX_LIMIT:
+        raise OutboxFullError(f"Recipient isn't reading ({outbox.size} bytes already queued)")
+    outbox.size += len(payload)
+    outbox.queue.put_nowait(payload)
+
+
+def send_response(writer: asyncio.StreamWriter, response: dict) -> None:
+    """Queue a JSON response for a client."""
+    send_payload(writer, dumps(response))
+
+
+async def writer_loop(writer: asyncio.StreamWriter, outbox: Outbox) -> None:
+    """Sole writer for a connection: frame queued payloads and flush them together.
+
+    Headers and payloads go out in one writelines() call, so each batch is
+    copied once instead of concatenating every frame as it is produced.
+    Writes go straight to the transport; the StreamWriter is only needed for
+    drain() when the transport pushes back.
+    """
+    transport = writer.transport
+    writelines = transport.writelines
+    buffered = transport.get_write_buffer_size
+    queue = outbox.queue
+    get = queue.get_nowait
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < WRITE_BATCH and not queue.empty():
+            batch.append(get())
+        chunks = []
+        batch_size = 0
+        for payload in batch:
+            batch_size += len(payload)
+            chunks.append(frame_header(payload))
+            chunks.append(payload)
+        writelines(chunks)
+        if buffered() > WRITE_HIGH_WATER:
+            await writer.drain()
+        # Counted until flushed, so a stalled peer's transport buffer stays bounded too
+        outbox.size -= batch_size
+
+
+async def handle_hello(params: dict, writer: asyncio.StreamWriter) -> dict:
+    """Confirm the client speaks this hub's protocol version."""
+    version = params.get("version")
+    if version != PROTOCOL_VERSION:
+        return {"error": f"Hub speaks protocol v{PROTOCOL_VERSION}, client v{version}"}
+    return {"version": PROTOCOL_VERSION}
 
 
 async def handle_listen(params: dict, writer: asyncio.StreamWriter) -> dict:
@@ -61,25 +189,26 @@ async def handle_listen(params: dict, writer: asyncio.StreamWriter) -> dict:
     session_name = params["session_name"]
     description = params["description"]
 
-    async with state.lock:
-        if session_name in state.sessions:
-            return {"error": f"Session '{session_name}' already exists"}
-        state.sessions[session_name] = Session(
-            name=session_name, description=description, writer=writer
-        )
+    session = Session(name=session_name, description=description, writer=writer)
+    if state.sessions.setdefault(session_name, session) is not session:
+        return {"error": f"Session '{session_name}' already exists"}
+    state.sessions_by_writer.setdefault(writer, set()).add(session_name)
+    state.session_list_json = None
+    schedule_idle_check(session, session.last_activity + IDLE_TIMEOUT_SECONDS)
 
     print(f"[HUB] Session '{session_name}' listening")
     return {"status": "listening", "session": session_name}
 
 
-async def handle_list_sessions(params: dict, writer: asyncio.StreamWriter) -> dict:
-    """List all active sessions."""
-    async with state.lock:
+async def handle_list_sessions(params: dict, writer: asyncio.StreamWriter) -> bytes:
+    """List all active sessions (pre-encoded, rebuilt only after changes)."""
+    if state.session_list_json is None:
         sessions = [
             {"name": s.name, "description": s.description, "busy": s.current_caller is not None}
             for s in state.sessions.values()
         ]
-    return {"sessions": sessions}
+        state.session_list_json = dumps({"sessions": sessions})
+    return state.session_list_json
 
 
 async def handle_connect(params: dict, writer: asyncio.StreamWriter) -> dict:
@@ -88,19 +217,24 @@ async def handle_connect(params: dict, writer: asyncio.StreamWriter) -> dict:
     intent = params["intent"]
     my_name = params["my_name"]
 
-    async with state.lock:
-        session = state.sessions.get(target)
-        if not session:
-            return {"error": f"Session '{target}' not found"}
-        if session.current_caller and session.current_caller != my_name:
-            return {"error": f"Session '{target}' is busy"}
-
-        session.current_caller = my_name
-        session.current_intent = intent
-        state.callers[my_name] = writer
+    session = state.sessions.get(target)
+    if not session:
+        return {"error": f"Session '{target}' not found"}
+    if session.current_caller and session.current_caller != my_name:
+        return {"error": f"Session '{target}' is busy"}
+
+    session.current_caller = my_name
+    session.current_intent = intent
+    session.last_activity = time.time()
+    session.intent_json = dumps(intent)
+    state.session_list_json = None
+    banner = format_intent_banner(intent)
+    session.banner_with_directive_json = dumps(banner)
+    session.banner_no_directive_json = dumps(format_intent_banner(intent, include_directive=False))
+    register_caller(my_name, writer)
 
     print(f"[HUB] '{my_name}' connected to '{target}'")
-    return {"connected": True, "target": target, "intent_banner": format_intent_banner(intent)}
+    return {"connected": True, "target": target, "intent_banner": banner}
 
 
 async def handle_send(params: dict, writer: asyncio.StreamWriter) -> dict:
@@ -109,27 +243,34 @@ async def handle_send(params: dict, writer: asyncio.StreamWriter) -> dict:
     message = params["message"]
     my_name = params["my_name"]
 
-    async with state.lock:
-        session = state.sessions.get(target)
-        if not session:
-            return {"error": f"Session '{target}' not found"}
+    session = state.sessions.get(target)
+    if not session:
+        return {"error": f"Session '{target}' not found"}
+
+    register_caller(my_name, writer)
+    session.last_activity = time.time()
+    listener_writer = session.writer
+    intent_json = session.intent_json
+    if not session.current_intent:
+        banner_json = b"null"
+    elif session.current_caller != my_name:
+        banner_json = session.banner_with_directive_json
+    else:
+        banner_json = session.banner_no_directive_json
+
+    # Splice the envelope from encoded fragments instead of dumping a fresh dict
+    payload = b"".join((
+        b'{"type":"message","from":', dumps(my_name),
+        b',"message":', dumps(message),
+        b',"intent":', intent_json,
+        b',"intent_banner":', banner_json,
+        b"}",
+    ))
 
-        state.callers[my_name] = writer
-        session.last_activity = time.time()
-        include_directive = session.current_caller != my_name
-
-        msg = {
-            "type": "message",
-            "from": my_name,
-            "message": message,
-            "intent": session.current_intent,
-            "intent_banner": format_intent_banner(session.current_intent, include_directive) if session.current_intent else None
-        }
-
-        try:
-            await send_response(session.writer, msg)
-        except Exception as e:
-            return {"error": f"Failed to send: {e}"}
+    try:
+        send_payload(listener_writer, payload)
+    except Exception as e:
+        return {"error": f"Failed to send: {e}"}
 
     return {"sent": True, "to": target}
 
@@ -139,41 +280,78 @@ async def handle_respond(params: dict, writer: asyncio.StreamWriter) -> dict:
     session_name = params["session_name"]
     message = params["message"]
 
-    async with state.lock:
-        session = state.sessions.get(session_name)
-        if not session:
-            return {"error": f"Session '{session_name}' not found"}
-        if not session.current_caller:
-            return {"error": "No caller connected"}
+    session = state.sessions.get(session_name)
+    if not session:
+        return {"error": f"Session '{session_name}' not found"}
+    if not session.current_caller:
+        return {"error": "No caller connected"}
 
-        caller_writer = state.callers.get(session.current_caller)
-        if not caller_writer:
-            return {"error": "Caller connection lost"}
+    caller_writer = state.callers.get(session.current_caller)
+    if not caller_writer:
+        return {"error": "Caller connection lost"}
 
-        session.last_activity = time.time()
-        msg = {"type": "response", "from": session_name, "message": message}
+    session.last_activity = time.time()
+    caller = session.current_caller
 
-        try:
-            await send_response(caller_writer, msg)
-        except Exception as e:
-            return {"error": f"Failed to respond: {e}"}
+    msg = {"type": "response", "from": session_name, "message": message}
+
+    try:
+        send_response(caller_writer, msg)
+    except Exception as e:
+        return {"error": f"Failed to respond: {e}"}
 
-    return {"sent": True, "to": session.current_caller}
+    return {"sent": True, "to": caller}
 
 
 async def handle_end_session(params: dict, writer: asyncio.StreamWriter) -> dict:
     """End a listening session."""
     session_name = params["session_name"]
 
-    async with state.lock:
-        if session_name in state.sessions:
-            del state.sessions[session_name]
+    remove_session(session_name)
 
     print(f"[HUB] Session '{session_name}' ended")
     return {"closed": True, "session": session_name}
 
 
+async def expire_idle_sessions() -> None:
+    """Close sessions idle for IDLE_TIMEOUT_SECONDS, sleeping until the next deadline.
+
+    Activity doesn't touch the heap: a due entry whose session has been active
+    since is simply pushed back to its new deadline.
+    """
+    heap = state.idle_heap
+    while True:
+        now = time.time()
+        expired = []
+        while heap and heap[0][0] <= now:
+            _, _, session = heapq.heappop(heap)
+            if state.sessions.get(session.name) is not session:
+                continue  # already ended or replaced
+            deadline = session.last_activity + IDLE_TIMEOUT_SECONDS
+            if deadline > now:
+                schedule_idle_check(session, deadline)
+                continue
+
+            remove_session(session.name)
+            expired.append(session)
+
+        # Notify once the registry is settled; the notice body is pre-encoded
+        for session in expired:
+            print(f"[HUB] Session '{session.name}' timed out")
+            try:
+                send_payload(session.writer, b"".join((
+                    b'{"type":"timeout","session":', dumps(session.name),
+                    b',"message":', TIMEOUT_MESSAGE_JSON,
+                    b"}",
+                )))
+            except ConnectionError:
+                pass
+
+        await asyncio.sleep(heap[0][0] - now if heap else IDLE_TIMEOUT_SECONDS)
+
+
 HANDLERS = {
+    "hello": handle_hello,
     "listen": handle_listen,
     "list_sessions": handle_list_sessions,
     "connect": handle_connect,
@@ -185,59 +363,145 @@ HANDLERS = {
 
 async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
     """Handle a connected MCP client."""
-    addr = writer.get_extra_info('peername')
+    addr = writer.get_extra_info('peername') or "unix socket"
     print(f"[HUB] Client connected from {addr}")
+    writer.transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+    outbox = Outbox()
+    state.outboxes[writer] = outbox
+    writer_task = asyncio.create_task(writer_loop(writer, outbox))
 
     try:
         while True:
-            data = await reader.readline()
-            if not data:
+            data = await read_frame(reader)
+            if data is None:
                 break
 
+            request = None
             try:
-                request = json.loads(data.decode())
-                action = request.get("action")
-                params = request.get("params", {})
-
-                handler = HANDLERS.get(action)
-                if handler:
-                    response = await handler(params, writer)
+                request = loads(data)
+                handler = HANDLERS[request["action"]]
+            except ValueError:
+                response = {"error": "Invalid JSON"}
+            except (KeyError, TypeError):
+                action = request.get("action") if isinstance(request, dict) else None
+                response = {"error": f"Unknown action: {action}"}
+            else:
+                try:
+                    response = await handler(request.get("params") or {}, writer)
+                except Exception as e:
+                    response = {"error": str(e)}
+
+            # Echo the request id so pipelining clients can match replies
+            req_id = request.get("id") if isinstance(request, dict) else None
+            try:
+                if isinstance(response, bytes):  # already-encoded reply
+                    if req_id is not None:
+                        response = b"".join((b'{"id":', dumps(req_id), b",", response[1:]))
+                    send_payload(writer, response)
                 else:
-                    response = {"error": f"Unknown action: {action}"}
-
-                if action != "listen" or "error" in response:
-                    await send_response(writer, response)
-
-            except json.JSONDecodeError:
-                await send_response(writer, {"error": "Invalid JSON"})
-            except Exception as e:
-                await send_response(writer, {"error": str(e)})
+                    if req_id is not None:
+                        response["id"] = req_id
+                    send_response(writer, response)
+            except FrameError as e:  # reply too large to frame
+                response = {"error": str(e)}
+                if req_id is not None:
+                    response["id"] = req_id
+                send_response(writer, response)
 
     except asyncio.CancelledError:
         pass
+    except FrameError as e:
+        print(f"[HUB] Dropping client {addr}: {e}")
     except Exception as e:
         print(f"[HUB] Client error: {e}")
     finally:
-        async with state.lock:
-            to_remove = [name for name, s in state.sessions.items() if s.writer == writer]
-            for name in to_remove:
-                del state.sessions[name]
-                print(f"[HUB] Session '{name}' cleaned up")
+        for name in state.sessions_by_writer.pop(writer, ()):
+            remove_session(name)
+            print(f"[HUB] Session '{name}' cleaned up")
+        for name in state.callers_by_writer.pop(writer, ()):
+            if state.callers.get(name) is writer:
+                del state.callers[name]
+
+        state.outboxes.pop(writer, None)
+        writer_task.cancel()
+        # Also collects a drain() failure if the writer died on a vanished peer
+        with contextlib.suppress(asyncio.CancelledError, ConnectionError):
+            await writer_task
 
         writer.close()
-        await writer.wait_closed()
+        with contextlib.suppress(ConnectionError):  # a reset peer re-raises here
+            await writer.wait_closed()
         print(f"[HUB] Client {addr} disconnected")
 
 
-async def run_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+def check_socket_path(path: str) -> None:
+    """Refuse a socket path that another user holds or could swap out."""
+    uid = os.getuid()
+    directory = os.path.dirname(path) or "."
+    dir_st = os.stat(directory)
+    if dir_st.st_uid not in (uid, 0):
+        raise SocketPathError(f"{directory} belongs to uid {dir_st.st_uid}; remove it or set PAF_HUB_SOCKET")
+    if dir_st.st_mode & 0o022 and not dir_st.st_mode & stat.S_ISVTX:
+        raise SocketPathError(f"{directory} is writable by other users; set PAF_HUB_SOCKET to a private path")
+    try:
+        owner = os.lstat(path).st_uid
+    except FileNotFoundError:
+        return
+    if owner != uid:
+        raise SocketPathError(f"{path} belongs to uid {owner}; remove it or set PAF_HUB_SOCKET")
+
+
+async def start_unix_server(path: str) -> asyncio.AbstractServer:
+    """Listen on a UNIX socket readable only by the current user."""
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    check_socket_path(path)
+    # The TCP port is already bound, so a socket file here is stale. Anything
+    # else at the path isn't ours to delete; binding will fail on it instead.
+    with contextlib.suppress(FileNotFoundError):
+        if stat.S_ISSOCK(os.lstat(path).st_mode):
+            os.unlink(path)
+    server = await asyncio.start_unix_server(handle_client, path=path, limit=STREAM_LIMIT)
+    try:
+        os.chmod(path, 0o600)
+    except OSError:
+        server.close()
+        raise
+    print(f"[HUB] Also listening on {path}")
+    return server
+
+
+async def run_server(
+    host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = HUB_SOCKET_PATH
+):
     """Run the hub server."""
-    server = await asyncio.start_server(handle_client, host, port)
-    addr = server.sockets[0].getsockname()
-    print(f"[HUB] Phone-a-Friend hub running on {addr[0]}:{addr[1]}")
+    servers = [await asyncio.start_server(handle_client, host, port, limit=STREAM_LIMIT)]
+    addr = servers[0].sockets[0].getsockname()
+    print(f"[HUB] Phone-a-Friend hub running on {addr[0]}:{addr[1]} (protocol v{PROTOCOL_VERSION})")
+
+    # Same-host clients skip the loopback TCP stack when they can
+    unix_path = None
+    if host == DEFAULT_HOST and hasattr(asyncio, "start_unix_server"):
+        try:
+            servers.append(await start_unix_server(socket_path))
+            unix_path = socket_path
+        except OSError as e:
+            print(f"[HUB] Can't listen on {socket_path} ({e}); TCP only")
+        except SocketPathError:
+            servers[0].close()
+            raise
     print(f"[HUB] Waiting for connections...")
 
-    async with server:
-        await server.serve_forever()
+    reaper = asyncio.create_task(expire_idle_sessions())
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            for server in servers:
+                await stack.enter_async_context(server)
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+    finally:
+        reaper.cancel()
+        if unix_path:
+            with contextlib.suppress(OSError):
+                os.unlink(unix_path)
 
 
 def main():
@@ -248,9 +512,17 @@ def main():
     print("=" * 50)
 
     try:
-        asyncio.run(run_server())
+        from uvloop import run as run_loop
+    except ImportError:
+        run_loop = asyncio.run
+
+    try:
+        run_loop(run_server())
     except KeyboardInterrupt:
         print("\n[HUB] Shutting down...")
+    except SocketPathError as e:
+        print(f"[HUB] Refusing to start: {e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
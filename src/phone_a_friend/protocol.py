@@ -0,0 +1,89 @@
+"""
+Wire protocol shared by the hub and MCP clients.
+
+Every message is a JSON object sent as a length-prefixed frame: a 4-byte
+big-endian payload length followed by the encoded payload.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+
+    def dumps_indent(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+except ImportError:  # stdlib fallback, same bytes-in/bytes-out contract
+    def dumps(obj) -> bytes:
+        # ASCII output always encodes, lone surrogates included
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+    def dumps_indent(obj) -> str:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
+PROTOCOL_VERSION = 2  # v1 was newline-delimited JSON
+HEADER_SIZE = 4
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+STREAM_LIMIT = 1 << 20  # StreamReader buffer size; reading pauses past twice this
+WRITE_HIGH_WATER = 64 * 1024  # only await drain() once this much is buffered
+
+
+def _default_socket_path() -> str:
+    """Per-user socket location: $XDG_RUNTIME_DIR, else a private directory under the temp dir."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "paf.sock")
+    owner = f"-{os.getuid()}" if hasattr(os, "getuid") else ""
+    return os.path.join(tempfile.gettempdir(), f"paf{owner}", "paf.sock")
+
+
+# Same-host fast path alongside the TCP port. Hub and clients resolve the same
+# path; a client that can't reach it falls back to TCP.
+HUB_SOCKET_PATH = os.environ.get("PAF_HUB_SOCKET") or _default_socket_path()
+
+
+class FrameError(ValueError):
+    """The peer sent a frame header this protocol version can't accept."""
+
+
+def frame_header(payload: bytes) -> bytes:
+    """Return the length header that precedes an encoded payload."""
+    return len(payload).to_bytes(HEADER_SIZE, "big")
+
+
+def split_frames(buffer: bytearray) -> list[bytes]:
+    """Remove and return every complete frame payload at the front of a receive buffer."""
+    payloads = []
+    start = 0
+    end = len(buffer)
+    with memoryview(buffer) as view:  # slice without an intermediate bytearray copy
+        while end - start >= HEADER_SIZE:
+            size = int.from_bytes(view[start:start + HEADER_SIZE], "big")
+            if size > MAX_FRAME_SIZE:
+                raise FrameError(f"Frame of {size} bytes exceeds limit (protocol v{PROTOCOL_VERSION})")
+            stop = start + HEADER_SIZE + size
+            if stop > end:
+                break
+            payloads.append(bytes(view[start + HEADER_SIZE:stop]))
+            start = stop
+    del buffer[:start]
+    return payloads
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    """Read one frame's payload. Returns None once the connection is closed."""
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+        size = int.from_bytes(header, "big")
+        if size > MAX_FRAME_SIZE:
+            raise FrameError(f"Frame of {size} bytes exceeds limit (protocol v{PROTOCOL_VERSION})")
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
@@ -1,13 +1,139 @@
 """MCP server that connects to the phone-a-friend hub."""
 
 import asyncio
-import json
+import itertools
+import os
+import socket
+import stat
+import struct
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 
+from .protocol import (
+    HEADER_SIZE, HUB_SOCKET_PATH, MAX_FRAME_SIZE, PROTOCOL_VERSION, WRITE_HIGH_WATER, FrameError,
+    dumps, dumps_indent, frame_header, loads, split_frames,
+)
+
 HUB_HOST = "127.0.0.1"
 HUB_PORT = 7777
+HUB_UNAVAILABLE = "Cannot connect to hub. Start with: python -m phone_a_friend.hub"
+HANDSHAKE_TIMEOUT = 5.0
+
+# The trailing newline is JSON whitespace to a v2 hub, but ends the line a v1
+# (newline-delimited) hub is waiting for, so it answers instead of hanging
+_HELLO = b'{"action":"hello","params":{"version":%d},"id":"hello"}\n' % PROTOCOL_VERSION
+_HELLO_FRAME = frame_header(_HELLO) + _HELLO
+
+# Tool output is our own formatted text, so skip pydantic validation
+_mk_text = TextContent.model_construct
+
+_REQUEST_PREFIXES: dict[str, bytes] = {}
+
+
+class HandshakeError(ConnectionError):
+    """The hub answered, but not in this client's protocol version."""
+
+
+def _is_own_socket(path: str) -> bool:
+    """True if path is a UNIX socket created by this user rather than someone else."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def _peer_is_own_user(transport: asyncio.Transport) -> bool:
+    """Check the listening process's uid where the kernel reports it (SO_PEERCRED)."""
+    sock = transport.get_extra_info("socket")
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return True  # only the socket file's owner could be checked
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid == os.getuid()
+
+
+def encode_request(buf: bytearray, req_id: int, action: str, params: dict) -> None:
+    """Append a framed hub request to an outgoing buffer without building an envelope dict.
+
+    The `{"action":...,"params":` prefix is encoded once per action, empty
+    params (list_sessions) skip the encoder entirely, and the length header is
+    patched in place once the payload has been written after it.
+    """
+    prefix = _REQUEST_PREFIXES.get(action)
+    if prefix is None:
+        prefix = _REQUEST_PREFIXES[action] = b'{"action":' + dumps(action) + b',"params":'
+    # Encode before touching buf, so a failure can't leave half a frame queued
+    body = dumps(params) if params else b"{}"
+    if len(body) > MAX_FRAME_SIZE - len(prefix) - 32:  # room for the id suffix
+        raise FrameError(f"Request of {len(body)} bytes exceeds the {MAX_FRAME_SIZE}-byte frame limit")
+    start = len(buf)
+    buf += bytes(HEADER_SIZE)
+    buf += prefix
+    buf += body
+    buf += b',"id":%d}' % req_id
+    buf[start:start + HEADER_SIZE] = (len(buf) - start - HEADER_SIZE).to_bytes(HEADER_SIZE, "big")
+
+
+def _fmt_message(result: dict) -> str:
+    """Format a message forwarded to a listener."""
+    banner = result.get("intent_banner")
+    sender = result.get("from", "unknown")
+    message = result.get("message", "")
+    return f"{banner}\nFROM: {sender}\n\n{message}" if banner else f"FROM: {sender}\n\n{message}"
+
+
+def _fmt_response(result: dict) -> str:
+    """Format a listener's reply to a caller."""
+    return f"FROM {result.get('from', 'unknown')}:\n\n{result.get('message', '')}"
+
+
+def _fmt_timeout(result: dict) -> str:
+    """Format an idle-timeout notice."""
+    return f"TIMED OUT: {result.get('session', 'session')}\n\n{result.get('message', '')}"
+
+
+def _fmt_connected(result: dict) -> str:
+    """Format a successful connect."""
+    banner = result.get("intent_banner")
+    return f"CONNECTED\n{banner}" if banner else "CONNECTED"
+
+
+def _fmt_sessions(result: dict) -> str:
+    """Format the list_sessions reply."""
+    sessions = result["sessions"]
+    if not sessions:
+        return "No active sessions"
+    # One string per session and a single join; no per-line list entries
+    return "ACTIVE SESSIONS:\n\n" + "\n".join([
+        f"  • {s['name']} {'(busy)' if s.get('busy') else '(available)'}\n    {s['description']}"
+        for s in sessions
+    ])
+
+
+def _fmt_sent(result: dict) -> str:
+    """Format a send acknowledgement."""
+    return f"✓ Sent to {result.get('to', 'recipient')}"
+
+
+def _fmt_closed(result: dict) -> str:
+    """Format an end_session acknowledgement."""
+    return f"✓ Session '{result.get('session')}' closed"
+
+
+_TYPE_FORMATTERS = {
+    "message": _fmt_message,
+    "response": _fmt_response,
+    "timeout": _fmt_timeout,
+}
+
+# Replies without a "type" are told apart by a truthy flag, checked in order
+_FLAG_FORMATTERS = (
+    ("connected", _fmt_connected),
+    ("sent", _fmt_sent),
+    ("closed", _fmt_closed),
+)
 
 
 def format_result(result: dict) -> str:
@@ -15,204 +141,341 @@ def format_result(result: dict) -> str:
     if "error" in result:
         return f"ERROR: {result['error']}"
 
-    msg_type = result.get("type")
-
-    if msg_type == "message":
-        parts = []
-        if result.get("intent_banner"):
-            parts.append(result["intent_banner"])
-        parts.append(f"FROM: {result.get('from', 'unknown')}")
-        parts.append("")
-        parts.append(result.get("message", ""))
-        return "\n".join(parts)
-
-    if msg_type == "response":
-        return f"FROM {result.get('from', 'unknown')}:\n\n{result.get('message', '')}"
-
-    if result.get("connected"):
-        parts = ["CONNECTED"]
-        if result.get("intent_banner"):
-            parts.append(result["intent_banner"])
-        return "\n".join(parts)
-
-    if "sessions" in result:
-        sessions = result["sessions"]
-        if not sessions:
-            return "No active sessions"
-        parts = ["ACTIVE SESSIONS:", ""]
-        for s in sessions:
-            status = "(busy)" if s.get("busy") else "(available)"
-            parts.append(f"  • {s['name']} {status}")
-            parts.append(f"    {s['description']}")
-        return "\n".join(parts)
-
-    if result.get("sent"):
-        return f"✓ Sent to {result.get('to', 'recipient')}"
-    if result.get("closed"):
-        return f"✓ Session '{result.get('session')}' closed"
-
-    return json.dumps(result, indent=2)
+    formatter = _TYPE_FORMATTERS.get(result.get("type"))
+    if formatter:
+        return formatter(result)
+
+    if "sessions" in result:  # present even when the list is empty
+        return _fmt_sessions(result)
+    for flag, formatter in _FLAG_FORMATTERS:
+        if result.get(flag):
+            return formatter(result)
+
+    return dumps_indent(result)
+
+
+class HubConnection(asyncio.Protocol):
+    """One hub connection: splits frames out of a single receive buffer.
+
+    Complete frames are decoded and handed to the client straight from
+    data_received(), with no StreamReader buffer or reader task in between.
+    Outgoing requests made in the same event-loop iteration are assembled
+    into one buffer and flushed together in one write.
+    """
+
+    def __init__(self, client: "HubClient"):
+        self.client = client
+        self.transport: asyncio.Transport | None = None
+        self._write = None  # transport.write, bound once per connection
+        self._rxbuf = bytearray()
+        self._txbuf = bytearray()
+        self._drain_waiter: asyncio.Future | None = None
+        # Resolves to None once the hub accepts the handshake, else to the reason it didn't
+        self.hello: asyncio.Future | None = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        self.hello = asyncio.get_running_loop().create_future()
+        self._write = transport.write
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        sock = transport.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            # Small request/reply frames: never let Nagle hold one back for an ACK
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data: bytes) -> None:
+        self._rxbuf += data
+        if not self.hello.done() and self._rxbuf[:1] == b"{":
+            # A frame header starts with a zero byte; a bare JSON line means v1
+            self._fail_hello("it speaks protocol v1")
+            return
+        try:
+            payloads = split_frames(self._rxbuf)
+        except FrameError as e:
+            self._fail_hello(str(e))
+            self.client.connection_lost(self, f"Hub error: {e}")
+            return
+        dispatch = self.client.dispatch
+        for payload in payloads:
+            message = loads(payload)
+            if self.hello.done():
+                dispatch(message)
+            else:  # nothing else is sent until the handshake reply is back
+                self.hello.set_result(message.get("error"))
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.resume_writing()
+        self._fail_hello("it closed the connection")
+        self.client.connection_lost(self, f"Hub error: {exc}" if exc else "Hub connection closed")
+
+    def _fail_hello(self, reason: str) -> None:
+        if self.hello is not None and not self.hello.done():
+            self.hello.set_result(reason)
+
+    def send_request(self, req_id: int, action: str, params: dict) -> None:
+        """Queue one request; a burst of concurrent requests goes out as a single write."""
+        flush_pending = bool(self._txbuf)
+        encode_request(self._txbuf, req_id, action, params)
+        if not flush_pending:
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        # Hand the buffer over rather than clearing it: the transport may keep
+        # a reference to whatever the socket didn't take yet.
+        buf, self._txbuf = self._txbuf, bytearray()
+        if not self.transport.is_closing():
+            self._write(buf)
+
+    def pause_writing(self) -> None:
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self) -> None:
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+        self._drain_waiter = None
+
+    @property
+    def write_paused(self) -> bool:
+        """True while the transport holds more than WRITE_HIGH_WATER unsent bytes."""
+        return self._drain_waiter is not None
+
+    async def drain(self) -> None:
+        """Wait until the transport has flushed below its high-water mark."""
+        if self._drain_waiter is not None:
+            await asyncio.shield(self._drain_waiter)
 
 
 class HubClient:
-    """Client for connecting to the phone-a-friend hub."""
+    """Client for connecting to the phone-a-friend hub.
+
+    Requests carry an id and are pipelined over one connection: incoming
+    frames resolve each caller's future from the echoed id, and frames the hub
+    pushes unprompted (messages for listeners, responses for callers) are queued.
+    """
 
     def __init__(self):
-        self.reader: asyncio.StreamReader | None = None
-        self.writer: asyncio.StreamWriter | None = None
-        self._lock = asyncio.Lock()
-
-    async def ensure_connected(self) -> bool:
-        """Ensure we're connected to the hub."""
-        if self.writer is None or self.writer.is_closing():
-            self.reader = None
-            self.writer = None
+        self.conn: HubConnection | None = None
+        self._connect_lock = asyncio.Lock()
+        self._ids = itertools.count()
+        self._pending: dict[int, asyncio.Future] = {}
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._closed: asyncio.Future | None = None
+
+    async def ensure_connected(self) -> str | None:
+        """Ensure we're connected to the hub; returns why not, or None once connected."""
+        # conn is cleared by _disconnect(), which every close path goes through
+        if self.conn is not None:
+            return None
+        async with self._connect_lock:
+            if self.conn is not None:
+                return None
+            self._disconnect()
+            self._inbox = asyncio.Queue()  # nothing pushed over a dead connection carries over
             try:
-                self.reader, self.writer = await asyncio.open_connection(HUB_HOST, HUB_PORT)
-                return True
+                self.conn = await self._open()
+            except HandshakeError as e:
+                return str(e)
             except Exception:
-                return False
-        return True
+                return HUB_UNAVAILABLE
+            self._closed = asyncio.get_running_loop().create_future()
+            return None
+
+    async def _open(self) -> HubConnection:
+        """Open a hub connection, preferring the same-host UNIX socket over TCP."""
+        loop = asyncio.get_running_loop()
+        factory = lambda: HubConnection(self)
+        # Another user's process at the path would see every request, so only
+        # talk to a socket, and a listener, owned by this user
+        if hasattr(socket, "AF_UNIX") and _is_own_socket(HUB_SOCKET_PATH):
+            try:
+                transport, conn = await loop.create_unix_connection(factory, HUB_SOCKET_PATH)
+            except (OSError, NotImplementedError):  # no hub socket, or a loop without UNIX support
+                pass
+            else:
+                if _peer_is_own_user(transport):
+                    await self._handshake(conn)
+                    return conn
+                transport.close()
+        _, conn = await loop.create_connection(factory, HUB_HOST, HUB_PORT)
+        await self._handshake(conn)
+        return conn
+
+    async def _handshake(self, conn: HubConnection) -> None:
+        """Check the hub speaks this protocol version before any request goes out."""
+        conn.transport.write(_HELLO_FRAME)
+        try:
+            reason = await asyncio.wait_for(asyncio.shield(conn.hello), HANDSHAKE_TIMEOUT)
+        except asyncio.TimeoutError:
+            reason = f"no reply within {HANDSHAKE_TIMEOUT:g}s"
+        if reason:
+            conn.transport.close()
+            raise HandshakeError(
+                f"Hub failed the protocol v{PROTOCOL_VERSION} handshake ({reason}). "
+                "Restart it with: python -m phone_a_friend.hub"
+            )
+
+    def _disconnect(self, error: str = "Hub connection closed") -> None:
+        """Drop the connection and fail everything still waiting on it."""
+        if self.conn is not None:
+            self.conn.transport.close()
+            self.conn = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result({"error": error})
+        self._pending.clear()
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def connection_lost(self, conn: HubConnection, error: str) -> None:
+        """Called by a connection that has closed or received a bad frame."""
+        if self.conn is conn:
+            self._disconnect(error)
+
+    def dispatch(self, message: dict) -> None:
+        """Route a decoded frame to its pending request by id, or to the inbox."""
+        if "id" not in message:  # pushed by the hub unprompted
+            self._inbox.put_nowait(message)
+            return
+        # Unknown ids are late replies to requests whose callers gave up
+        future = self._pending.pop(message.pop("id"), None)
+        if future is not None and not future.done():
+            future.set_result(message)
 
     async def send_request(self, action: str, params: dict) -> dict:
         """Send a request and get response."""
-        async with self._lock:
-            if not await self.ensure_connected():
-                return {"error": "Cannot connect to hub. Start with: python -m phone_a_friend.hub"}
-
-            request = {"action": action, "params": params}
-            try:
-                self.writer.write((json.dumps(request) + "\n").encode())
-                await self.writer.drain()
-                response = await self.reader.readline()
-                if not response:
-                    return {"error": "Hub connection closed"}
-                return json.loads(response.decode())
-            except Exception as e:
-                self.writer = None
-                self.reader = None
-                return {"error": f"Hub error: {e}"}
+        error = await self.ensure_connected()
+        if error:
+            return {"error": error}
+
+        conn = self.conn
+        req_id = next(self._ids)
+        try:
+            conn.send_request(req_id, action, params)
+        except (TypeError, ValueError) as e:  # nothing was queued; the connection is fine
+            return {"error": f"Cannot encode request: {e}"}
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = future
+        try:
+            if conn.write_paused:  # only when the kernel is actually pushing back
+                await conn.drain()
+            return await future
+        except Exception as e:
+            self._disconnect(f"Hub error: {e}")
+            return {"error": f"Hub error: {e}"}
+        finally:
+            self._pending.pop(req_id, None)
+
+    async def next_message(self) -> dict:
+        """Wait for the next frame the hub pushes without a request id."""
+        if not self._inbox.empty():
+            return self._inbox.get_nowait()
+        if self._closed is None or self._closed.done():
+            return {"error": "Hub connection closed while waiting"}
+
+        getter = asyncio.ensure_future(self._inbox.get())
+        try:
+            await asyncio.wait((getter, self._closed), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # Don't let an abandoned wait swallow the next message
+            if getter.done() and not getter.cancelled():
+                self._inbox.put_nowait(getter.result())
+            raise
+        finally:
+            getter.cancel()
+        if getter.done() and not getter.cancelled():
+            return getter.result()
+        return {"error": "Hub connection closed while waiting"}
 
     async def wait_for_message(self, action: str, params: dict) -> dict:
         """Send request and wait for async message (for listen)."""
-        async with self._lock:
-            if not await self.ensure_connected():
-                return {"error": "Cannot connect to hub. Start with: python -m phone_a_friend.hub"}
+        result = await self.send_request(action, params)
+        if result.get("status") != "listening":
+            return result
+        return await self.next_message()
 
-            request = {"action": action, "params": params}
-            try:
-                self.writer.write((json.dumps(request) + "\n").encode())
-                await self.writer.drain()
-
-                # First response is "listening" confirmation
-                response = await self.reader.readline()
-                if not response:
-                    return {"error": "Hub connection closed"}
-
-                result = json.loads(response.decode())
-                if result.get("status") == "listening":
-                    # Wait for actual message
-                    message = await self.reader.readline()
-                    if not message:
-                        return {"error": "Hub connection closed while waiting"}
-                    return json.loads(message.decode())
-
-                return result
-            except Exception as e:
-                self.writer = None
-                self.reader = None
-                return {"error": f"Hub error: {e}"}
+    async def wait_response(self) -> dict:
+        """Wait for the next pushed message without sending anything (for callers)."""
+        error = await self.ensure_connected()
+        if error:
+            return {"error": error}
+        return await self.next_message()
 
 
 hub = HubClient()
 server = Server("phone-a-friend")
 
 
+_TOOLS = [
+    Tool(
+        name="paf",
+        description="Phone-a-Friend: Claude-to-Claude communication. Actions: listen (block waiting for messages), list_sessions, connect (initiate with intent), send, wait_response (block for reply), respond, end_session.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "action": {
+                    "type": "string",
+                    "enum": ["listen", "list_sessions", "connect", "send", "wait_response", "respond", "end_session"],
+                    "description": "Operation: listen/list_sessions/connect/send/wait_response/respond/end_session"
+                },
+                "session_name": {"type": "string", "description": "Your session name (listen/respond/end_session)"},
+                "target_session": {"type": "string", "description": "Target session (connect/send)"},
+                "message": {"type": "string", "description": "Message content (send/respond)"},
+                "my_name": {"type": "string", "description": "Your identifier (connect/send/wait_response)"},
+                "intent": {"type": "string", "description": "Conversation focus (connect)"},
+                "description": {"type": "string", "description": "What you can help with (listen)"}
+            },
+            "required": ["action"]
+        }
+    )
+]
+
+
+# action -> (required arguments forwarded as params, blocks for a pushed message)
+_ACTIONS = {
+    "listen": (("session_name", "description"), True),
+    "list_sessions": ((), False),
+    "connect": (("target_session", "intent", "my_name"), False),
+    "send": (("target_session", "message", "my_name"), False),
+    "respond": (("session_name", "message"), False),
+    "end_session": (("session_name",), False),
+}
+
+
 @server.list_tools()
 async def list_tools() -> list[Tool]:
     """List available tools."""
-    return [
-        Tool(
-            name="paf",
-            description="Phone-a-Friend: Claude-to-Claude communication. Actions: listen (block waiting for messages), list_sessions, connect (initiate with intent), send, wait_response (block for reply), respond, end_session.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "action": {
-                        "type": "string",
-                        "enum": ["listen", "list_sessions", "connect", "send", "wait_response", "respond", "end_session"],
-                        "description": "Operation: listen/list_sessions/connect/send/wait_response/respond/end_session"
-                    },
-                    "session_name": {"type": "string", "description": "Your session name (listen/respond/end_session)"},
-                    "target_session": {"type": "string", "description": "Target session (connect/send)"},
-                    "message": {"type": "string", "description": "Message content (send/respond)"},
-                    "my_name": {"type": "string", "description": "Your identifier (connect/send/wait_response)"},
-                    "intent": {"type": "string", "description": "Conversation focus (connect)"},
-                    "description": {"type": "string", "description": "What you can help with (listen)"}
-                },
-                "required": ["action"]
-            }
-        )
-    ]
+    return _TOOLS
 
 
 @server.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     """Handle tool calls."""
     if name != "paf":
-        return [TextContent(type="text", text=f"ERROR: Unknown tool: {name}")]
+        return [_mk_text(type="text", text=f"ERROR: Unknown tool: {name}")]
 
     action = arguments.get("action")
     if not action:
-        return [TextContent(type="text", text="ERROR: action parameter required")]
+        return [_mk_text(type="text", text="ERROR: action parameter required")]
 
     try:
-        if action == "listen":
-            result = await hub.wait_for_message("listen", {
-                "session_name": arguments["session_name"],
-                "description": arguments["description"]
-            })
-        elif action == "list_sessions":
-            result = await hub.send_request("list_sessions", {})
-        elif action == "connect":
-            result = await hub.send_request("connect", {
-                "target_session": arguments["target_session"],
-                "intent": arguments["intent"],
-                "my_name": arguments["my_name"]
-            })
-        elif action == "send":
-            result = await hub.send_request("send", {
-                "target_session": arguments["target_session"],
-                "message": arguments["message"],
-                "my_name": arguments["my_name"]
-            })
-        elif action == "wait_response":
-            if not await hub.ensure_connected():
-                result = {"error": "Cannot connect to hub"}
-            else:
-                try:
-                    response = await hub.reader.readline()
-                    result = json.loads(response.decode()) if response else {"error": "Connection closed"}
-                except Exception as e:
-                    result = {"error": f"Error waiting: {e}"}
-        elif action == "respond":
-            result = await hub.send_request("respond", {
-                "session_name": arguments["session_name"],
-                "message": arguments["message"]
-            })
-        elif action == "end_session":
-            result = await hub.send_request("end_session", {
-                "session_name": arguments["session_name"]
-            })
-        else:
+        spec = _ACTIONS.get(action)
+        if action == "wait_response":
+            result = await hub.wait_response()
+        elif spec is None:
             result = {"error": f"Unknown action: {action}"}
+        else:
+            keys, waits = spec
+            params = {key: arguments[key] for key in keys}
+            request = hub.wait_for_message if waits else hub.send_request
+            result = await request(action, params)
 
-        return [TextContent(type="text", text=format_result(result))]
+        return [_mk_text(type="text", text=format_result(result))]
 
     except KeyError as e:
-        return [TextContent(type="text", text=f"ERROR: Missing parameter: {e}")]
+        return [_mk_text(type="text", text=f"ERROR: Missing parameter: {e}")]
     except Exception as e:
-        return [TextContent(type="text", text=f"ERROR: {e}")]
+        return [_mk_text(type="text", text=f"ERROR: {e}")]
 
 
 def main():
@@ -221,7 +484,11 @@ def main():
         async with stdio_server() as (read_stream, write_stream):
             await server.run(read_stream, write_stream, server.create_initialization_options())
 
-    asyncio.run(run())
+    try:
+        from uvloop import run as run_loop
+    except ImportError:
+        run_loop = asyncio.run
+    run_loop(run())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+"""HubClient request pipelining against an in-process hub."""
+
+import asyncio
+
+import pytest
+
+from phone_a_friend import hub, server
+from phone_a_friend.protocol import PROTOCOL_VERSION, dumps, frame_header, loads, read_frame
+
+
+@pytest.fixture
+def hub_env(monkeypatch, tmp_path):
+    """Point clients at a fresh hub on an ephemeral TCP port."""
+    monkeypatch.setattr(hub, "state", hub.HubState())
+    monkeypatch.setattr(server, "HUB_SOCKET_PATH", str(tmp_path / "missing.sock"))
+
+    async def start(handler=hub.handle_client):
+        srv = await asyncio.start_server(handler, "127.0.0.1", 0)
+        monkeypatch.setattr(server, "HUB_PORT", srv.sockets[0].getsockname()[1])
+        return srv
+
+    return start
+
+
+async def listen_and_connect(listener, caller):
+    """Register session "a" and connect "c" to it; returns the blocked listen task."""
+    listen = asyncio.create_task(listener.wait_for_message(
+        "listen", {"session_name": "a", "description": "d"}
+    ))
+    await asyncio.sleep(0.05)
+    assert (await caller.send_request(
+        "connect", {"target_session": "a", "intent": "i", "my_name": "c"}
+    ))["connected"]
+    return listen
+
+
+def test_cancelled_wait_keeps_next_message(hub_env):
+    async def main():
+        srv = await hub_env()
+        listener, caller = server.HubClient(), server.HubClient()
+        listen = await listen_and_connect(listener, caller)
+
+        waiting = asyncio.create_task(caller.wait_response())
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        await caller.send_request("send", {"target_session": "a", "message": "q", "my_name": "c"})
+        assert (await asyncio.wait_for(listen, 2))["message"] == "q"
+        await listener.send_request("respond", {"session_name": "a", "message": "answer"})
+        reply = await asyncio.wait_for(caller.wait_response(), 2)
+        assert reply == {"type": "response", "from": "a", "message": "answer"}
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_late_reply_to_cancelled_request_is_dropped(hub_env):
+    async def main():
+        srv = await hub_env()
+        listener, caller = server.HubClient(), server.HubClient()
+        listen = await listen_and_connect(listener, caller)
+
+        request = asyncio.create_task(caller.send_request("list_sessions", {}))
+        await asyncio.sleep(0)  # queued, reply not yet back
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+
+        await caller.send_request("send", {"target_session": "a", "message": "q", "my_name": "c"})
+        await asyncio.wait_for(listen, 2)
+        await listener.send_request("respond", {"session_name": "a", "message": "answer"})
+        reply = await asyncio.wait_for(caller.wait_response(), 2)
+        assert reply["type"] == "response" and reply["message"] == "answer"
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_out_of_order_replies_reach_their_callers(hub_env):
+    async def reversing_hub(reader, writer):
+        """Answer each pair of requests in reverse order, echoing the action."""
+        requests = []
+        while (data := await read_frame(reader)) is not None:
+            request = loads(data)
+            if request["action"] == "hello":
+                payload = dumps({"id": request["id"], "version": PROTOCOL_VERSION})
+                writer.write(frame_header(payload) + payload)
+                continue
+            requests.append(request)
+            if len(requests) == 2:
+                for request in reversed(requests):
+                    payload = dumps({"id": request["id"], "echo": request["action"]})
+                    writer.write(frame_header(payload) + payload)
+                requests.clear()
+
+    async def main():
+        srv = await hub_env(reversing_hub)
+        client = server.HubClient()
+        first, second = await asyncio.wait_for(asyncio.gather(
+            client.send_request("list_sessions", {}),
+            client.send_request("end_session", {"session_name": "x"}),
+        ), 2)
+        assert first == {"echo": "list_sessions"}
+        assert second == {"echo": "end_session"}
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_inbox_does_not_outlive_its_connection(hub_env):
+    async def main():
+        srv = await hub_env()
+        client = server.HubClient()
+        assert await client.ensure_connected() is None
+        client.dispatch({"type": "response", "from": "old", "message": "stale"})
+        client.conn.transport.close()
+        await asyncio.sleep(0.05)
+
+        assert await client.ensure_connected() is None
+        waiting = asyncio.create_task(client.wait_response())
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        waiting.cancel()
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_v1_hub_fails_the_handshake_instead_of_hanging(hub_env):
+    async def v1_hub(reader, writer):
+        """Answer every line the way the newline-delimited v1 hub did."""
+        while await reader.readline():
+            writer.write(b'{"error": "Invalid JSON"}\n')
+
+    async def main():
+        srv = await hub_env(v1_hub)
+        result = await asyncio.wait_for(server.HubClient().send_request("list_sessions", {}), 2)
+        assert "protocol v1" in result["error"]
+        srv.close()
+
+    asyncio.run(main())
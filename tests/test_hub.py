@@ -0,0 +1,102 @@
+"""Hub behaviour exercised over real connections to an in-process hub."""
+
+import asyncio
+
+import pytest
+
+from phone_a_friend import hub, server
+from phone_a_friend.protocol import MAX_FRAME_SIZE, frame_header, loads, read_frame
+
+
+@pytest.fixture
+def hub_env(monkeypatch, tmp_path):
+    """Point clients at a fresh hub on an ephemeral TCP port."""
+    monkeypatch.setattr(hub, "state", hub.HubState())
+    monkeypatch.setattr(server, "HUB_SOCKET_PATH", str(tmp_path / "missing.sock"))
+
+    async def start():
+        srv = await asyncio.start_server(hub.handle_client, "127.0.0.1", 0)
+        monkeypatch.setattr(server, "HUB_PORT", srv.sockets[0].getsockname()[1])
+        return srv
+
+    return start
+
+
+def test_send_to_stalled_listener_fails_once_outbox_is_full(hub_env):
+    async def main():
+        srv = await hub_env()
+        listener, caller = server.HubClient(), server.HubClient()
+        asyncio.create_task(listener.wait_for_message(
+            "listen", {"session_name": "a", "description": "d"}
+        ))
+        await asyncio.sleep(0.05)
+        listener.conn.transport.pause_reading()
+
+        message = "x" * (1 << 20)
+        for sent in range(100):
+            result = await caller.send_request(
+                "send", {"target_session": "a", "message": message, "my_name": "c"}
+            )
+            if "error" in result:
+                break
+        assert "isn't reading" in result["error"]
+        assert sent < 100
+        assert all(box.size <= hub.OUTBOX_LIMIT for box in hub.state.outboxes.values())
+        listener.conn.transport.abort()  # the hub can't flush to it, so don't wait for that
+        await asyncio.sleep(0.05)
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_empty_frame_gets_an_error_reply(hub_env):
+    async def main():
+        srv = await hub_env()
+        port = srv.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(frame_header(b""))
+        assert loads(await asyncio.wait_for(read_frame(reader), 2)) == {"error": "Invalid JSON"}
+        writer.close()
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_oversized_forward_fails_for_the_sender_only(hub_env):
+    async def main():
+        srv = await hub_env()
+        listener, caller = server.HubClient(), server.HubClient()
+        listen = asyncio.create_task(listener.wait_for_message(
+            "listen", {"session_name": "a", "description": "d"}
+        ))
+        await asyncio.sleep(0.05)
+        # Fits in the request frame, but not once the hub adds the intent banner
+        await caller.send_request("connect", {"target_session": "a", "intent": "i" * 4096, "my_name": "c"})
+        result = await caller.send_request(
+            "send", {"target_session": "a", "message": "x" * (MAX_FRAME_SIZE - 256), "my_name": "c"}
+        )
+        assert "frame limit" in result["error"]
+
+        await caller.send_request("send", {"target_session": "a", "message": "small", "my_name": "c"})
+        assert (await asyncio.wait_for(listen, 2))["message"] == "small"
+        srv.close()
+
+    asyncio.run(main())
+
+
+def test_idle_heap_drops_ended_sessions(hub_env):
+    async def main():
+        srv = await hub_env()
+        client = server.HubClient()
+        for i in range(200):
+            name = f"s{i}"
+            listen = asyncio.create_task(client.wait_for_message(
+                "listen", {"session_name": name, "description": "d"}
+            ))
+            await asyncio.sleep(0)
+            await client.send_request("end_session", {"session_name": name})
+            listen.cancel()
+        assert len(hub.state.idle_heap) <= 2 * len(hub.state.sessions) + 16
+        srv.close()
+
+    asyncio.run(main())